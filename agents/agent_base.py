@@ -1,20 +1,117 @@
 """Base class and utilities for AI agents with OpenAI integration."""
 
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+import asyncio
+import atexit
 import os
+import random
+import httpx
+import numpy as np
 from loguru import logger
-from openai import OpenAI, APIError, APIConnectionError, RateLimitError
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    APIError,
+    InternalServerError,
+    RateLimitError,
+)
 from dotenv import load_dotenv
+from agents.response_cache import MAX_CACHEABLE_TEMPERATURE, ResponseCache
+from agents.semantic_cache import EMBEDDING_MODEL, SemanticCache
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Errors worth retrying; anything else (bad request, auth, ...) is raised as-is.
+# APIConnectionError also covers APITimeoutError.
+TRANSIENT_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+MAX_BACKOFF_SECONDS = 30
+MODEL = "gpt-4"
+# Upper bound accepted for max_tokens on any single request
+MAX_RESPONSE_TOKENS = 4096
+# Non-streaming read timeout: a fixed allowance plus the time to generate
+# max_tokens at a slow but realistic rate for gpt-4
+BASE_READ_TIMEOUT_SECONDS = 60.0
+MIN_TOKENS_PER_SECOND = 10
+# Streams deliver chunks continuously, so only the gap between reads matters
+STREAM_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+# Message content is truncated to this many characters in debug logs
+LOG_CONTENT_CHARS = 200
+
+# Shared across all agents so concurrent calls reuse pooled connections
+# instead of paying a TCP/TLS handshake per request. HTTP/2 multiplexes
+# many in-flight requests over each connection.
+_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=256, max_keepalive_connections=64),
+    # Same 600s read default as the SDK; call_openai passes a tighter,
+    # reply-sized timeout per request
+    timeout=httpx.Timeout(600.0, connect=5.0),
+    http2=True,
+)
+# max_retries=0: retries are handled by AgentBase with its own backoff, so
+# the SDK's built-in retries would multiply the number of attempts
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"), http_client=_http_client, max_retries=0
+)
+
+
+async def shutdown() -> None:
+    """Close the shared OpenAI client and its connection pool.
+
+    Call this before the event loop that made requests is closed.
+    """
+    await client.close()
+
+
+@atexit.register
+def _close_at_exit() -> None:
+    """Best-effort cleanup for programs that never awaited shutdown()."""
+    if _http_client.is_closed:
+        return
+    try:
+        asyncio.run(shutdown())
+    except Exception as e:  # pylint: disable=broad-except
+        # The loop that owned the connections may already be gone
+        logger.debug(f"Could not close OpenAI client at exit: {str(e)}")
+
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> ResponseCache:
+    """Return the shared response cache, opening it on first use."""
+    return ResponseCache(os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite"))
+
+
+def _backoff_delay(retries: int) -> float:
+    """Exponential backoff with jitter before retry number `retries`.
+
+    Callers await asyncio.sleep on this so other coroutines keep running.
+    """
+    return min(MAX_BACKOFF_SECONDS, 2**retries + random.random())
+
+
+def _request_timeout(max_tokens: int) -> httpx.Timeout:
+    """Read timeout long enough for a reply of up to max_tokens tokens."""
+    read = BASE_READ_TIMEOUT_SECONDS + max_tokens / MIN_TOKENS_PER_SECOND
+    return httpx.Timeout(read, connect=5.0)
+
+
+def _check_max_tokens(max_tokens: int) -> None:
+    """Raise ValueError unless 1 <= max_tokens <= MAX_RESPONSE_TOKENS."""
+    if not 1 <= max_tokens <= MAX_RESPONSE_TOKENS:
+        raise ValueError(
+            f"max_tokens must be between 1 and {MAX_RESPONSE_TOKENS}, got {max_tokens}"
+        )
 
 
 class OpenAIError(Exception):
     """Custom exception for OpenAI-related errors."""
 
 
+class TruncatedResponseError(OpenAIError):
+    """The reply was cut off by max_tokens (finish_reason "length")."""
+
+
 class AgentBase(ABC):
     """
     Base class for AI agents that defines the common interface.
@@ -23,70 +120,317 @@ class AgentBase(ABC):
         name: The agent's identifier
         max_retries: Maximum number of retry attempts for API calls
         verbose: Whether to log detailed information
+        semantic_cache: Optional cache of replies to near-duplicate inputs
     """
 
-    def __init__(self, name: str, max_retries: int = 2, verbose: bool = True) -> None:
+    def __init__(
+        self,
+        name: str,
+        max_retries: int = 2,
+        verbose: bool = True,
+        semantic_cache: Optional[SemanticCache] = None,
+    ) -> None:
         self.name = name
         self.max_retries = max_retries
         self.verbose = verbose
+        self.semantic_cache = semantic_cache
 
     @abstractmethod
-    async def execute(self) -> Any:
+    async def execute(self, data: str) -> Any:
         """
-        Execute the agent's main functionality.
+        Execute the agent's main functionality on a single input.
         Must be implemented by subclasses.
+
+        Args:
+            data: The text the agent operates on
+        """
+
+    async def execute_many(self, items: List[str], concurrency: int = 20) -> List[Any]:
         """
+        Run execute() over many inputs concurrently.
+
+        Args:
+            items: Inputs to pass to execute(), one call per item
+            concurrency: Maximum number of in-flight calls; tune to your
+                OpenAI rate limit tier
+
+        Returns:
+            Results in the same order as items. Failed items are returned as
+            their exception instead of aborting the whole batch.
+        """
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1")
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _run_one(index: int, item: str) -> Any:
+            async with semaphore:
+                try:
+                    return await self.execute(item)
+                except Exception as e:
+                    logger.error(f"[{self.name}] Item {index} failed: {str(e)}")
+                    raise
+
+        return await asyncio.gather(
+            *(_run_one(i, item) for i, item in enumerate(items)),
+            return_exceptions=True,
+        )
 
-    def call_openai(
+    async def call_openai(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
-        max_tokens: int = 150,
-    ) -> Dict[str, str]:
+        *,
+        max_tokens: int,
+        cache: bool = True,
+        semantic_key: Optional[str] = None,
+        **request_args: Any,
+    ) -> str:
         """
         Make an API call to OpenAI's chat completion endpoint.
 
         Args:
             messages: List of message dictionaries with 'role' and 'content'
             temperature: Controls randomness in the response (0-1)
-            max_tokens: Maximum tokens in the response
+            max_tokens: Maximum tokens in the response, 1 to MAX_RESPONSE_TOKENS.
+                Required so every caller sizes it to the reply it expects; an
+                oversized budget reserves server capacity and can add queueing
+            cache: Whether to serve and store the reply in the response cache
+                and semantic cache. The response cache is only applied when
+                temperature <= 0.1, since sampled replies are not reproducible
+            semantic_key: Input text to match against the agent's semantic
+                cache, if it has one. Typically the raw user document
+            **request_args: Extra chat completion parameters, e.g. model (defaults
+                to MODEL) or response_format={"type": "json_object"}. JSON mode
+                needs a model that supports it; base gpt-4 does not.
+                prompt_cache_key, the routing hint for OpenAI's automatic prefix
+                caching, defaults to the agent name so requests sharing the
+                same static system prompt hit the same cache
 
         Returns:
-            The message content from OpenAI's response
+            The message content from OpenAI's response, as plain text
 
         Raises:
-            OpenAIError: If the API call fails after max retries
+            ValueError: If max_tokens is out of range
+            OpenAIError: If the API call fails after max retries or the
+                response has no content
+            TruncatedResponseError: If the reply hit max_tokens. Truncated
+                replies are never cached
+            openai.APIStatusError: On non-transient errors such as bad requests
+                or authentication failures, which are not retried
         """
+        _check_max_tokens(max_tokens)
+        model = request_args.pop("model", MODEL)
+        # A routing hint only, so it is left out of the response cache key
+        prompt_cache_key = request_args.pop("prompt_cache_key", self.name)
+
+        cache_key = None
+        if cache and temperature <= MAX_CACHEABLE_TEMPERATURE:
+            cache_key = ResponseCache.make_key(
+                model, messages, temperature, max_tokens, request_args
+            )
+            cached = self._cached_reply(cache_key)
+            if cached is not None:
+                return cached
+
+        semantic_vec = None
+        if cache and semantic_key:
+            semantic_vec, similar = await self._semantic_lookup(semantic_key)
+            if similar is not None:
+                return similar
+
+        reply = await self._request_completion(
+            {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "prompt_cache_key": prompt_cache_key,
+                "timeout": _request_timeout(max_tokens),
+                **request_args,
+            }
+        )
+        self._store_reply(reply, cache_key, semantic_vec)
+        return reply
+
+    def _cached_reply(self, cache_key: str) -> Optional[str]:
+        """Return the response cache entry for cache_key, or None on a miss."""
+        cached = get_response_cache().get(cache_key)
+        if not isinstance(cached, str):
+            return None
+        if self.verbose:
+            logger.info(f"[{self.name}] Response served from cache")
+        return cached
+
+    async def _semantic_lookup(
+        self, semantic_key: str
+    ) -> Tuple[Optional[np.ndarray], Optional[str]]:
+        """Look up semantic_key in the agent's semantic cache, if it has one.
+
+        Returns:
+            The embedding of semantic_key, for storing the reply on a miss,
+            and the cached reply to a near-duplicate input, if any. Both are
+            None when there is no cache or the embedding failed
+        """
+        if self.semantic_cache is None:
+            return None, None
+        semantic_vec = await self._embed(semantic_key)
+        if semantic_vec is None:
+            return None, None
+        similar = self.semantic_cache.lookup(semantic_vec)
+        if similar is not None and self.verbose:
+            logger.info(f"[{self.name}] Response served from semantic cache")
+        return semantic_vec, similar
+
+    def _store_reply(
+        self,
+        reply: str,
+        cache_key: Optional[str],
+        semantic_vec: Optional[np.ndarray],
+    ) -> None:
+        """Save reply in whichever caches the request was looked up in."""
+        if cache_key is not None:
+            get_response_cache().set(cache_key, reply)
+        if semantic_vec is not None:
+            self.semantic_cache.add(semantic_vec, reply)
+
+    async def _request_completion(self, request: Dict[str, Any]) -> str:
+        """Send a chat completion request, retrying transient errors.
+
+        Args:
+            request: Keyword arguments for client.chat.completions.create
+
+        Returns:
+            The content of the first choice in the response
+        """
+        if self.verbose:
+            # Logged once rather than per attempt; lazy so the payload is
+            # only formatted when DEBUG records are actually emitted
+            logger.opt(lazy=True).debug(
+                "[{name}] messages: {msgs}",
+                name=lambda: self.name,
+                msgs=lambda: [
+                    (m["role"], m["content"][:LOG_CONTENT_CHARS])
+                    for m in request["messages"]
+                ],
+            )
+
         retries = 0
         while retries < self.max_retries:
             try:
                 if self.verbose:
                     logger.info(f"[{self.name}] Sending message to OpenAI")
-                    for message in messages:
-                        logger.debug(f" {message['role']}: {message['content']}")
 
-                response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                )
+                response = await client.chat.completions.create(**request)
 
                 if not response.choices:
                     raise OpenAIError("No choices in OpenAI response")
 
-                reply = response.choices[0].message
+                choice = response.choices[0]
+                if choice.finish_reason == "length":
+                    raise TruncatedResponseError(
+                        f"Response truncated at max_tokens={request['max_tokens']}"
+                    )
+                reply = choice.message.content
+                if reply is None:
+                    raise OpenAIError("No content in OpenAI response")
 
                 if self.verbose:
                     logger.info(f"[{self.name}] Received response: {reply}")
-
                 return reply
 
-            except (APIError, APIConnectionError, RateLimitError) as e:
+            except TRANSIENT_ERRORS as e:
                 retries += 1
                 logger.error(
                     f"[{self.name}] Error calling OpenAI: {str(e)}. "
                     f"Attempt {retries}/{self.max_retries}"
                 )
+                if retries < self.max_retries:
+                    await asyncio.sleep(_backoff_delay(retries))
 
         raise OpenAIError(f"Failed to get response after {self.max_retries} retries")
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed text for semantic cache lookups.
+
+        Returns None instead of raising if the embedding call fails, so that
+        the request can still be served without the cache.
+        """
+        try:
+            response = await client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+        except APIError as e:
+            logger.error(f"[{self.name}] Embedding failed, skipping cache: {str(e)}")
+            return None
+        return SemanticCache.normalize(response.data[0].embedding)
+
+    async def stream_openai(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        *,
+        max_tokens: int,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat completion from OpenAI as it is generated.
+
+        Only opening the stream is retried; an error mid-stream is raised to
+        the caller, since part of the reply has already been yielded.
+
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            temperature: Controls randomness in the response (0-1)
+            max_tokens: Maximum tokens in the response, 1 to MAX_RESPONSE_TOKENS.
+                Required so every caller sizes it to the reply it expects; an
+                oversized budget reserves server capacity and can add queueing
+
+        Yields:
+            Pieces of the reply text in the order they arrive
+
+        Raises:
+            ValueError: If max_tokens is out of range
+            OpenAIError: If the stream cannot be opened after max retries
+        """
+        _check_max_tokens(max_tokens)
+
+        if self.verbose:
+            logger.info(f"[{self.name}] Streaming message from OpenAI")
+
+        retries = 0
+        while True:
+            try:
+                stream = await client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    prompt_cache_key=self.name,
+                    stream=True,
+                    timeout=STREAM_TIMEOUT,
+                )
+                break
+            except TRANSIENT_ERRORS as e:
+                retries += 1
+                logger.error(
+                    f"[{self.name}] Error opening OpenAI stream: {str(e)}. "
+                    f"Attempt {retries}/{self.max_retries}"
+                )
+                if retries >= self.max_retries:
+                    raise OpenAIError(
+                        f"Failed to open stream after {self.max_retries} retries"
+                    ) from e
+                await asyncio.sleep(_backoff_delay(retries))
+
+        # Closes the HTTP response even if the caller stops iterating early
+        # or an error is raised mid-stream, so its connection is released
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta.content:
+                    yield choice.delta.content
+                if choice.finish_reason == "length":
+                    # Already yielded, so the caller can only be warned
+                    logger.warning(
+                        f"[{self.name}] Stream truncated at max_tokens={max_tokens}"
+                    )
@@ -0,0 +1,103 @@
+"""SQLite-backed cache for deterministic OpenAI chat completion responses."""
+
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import sqlite3
+import time
+from loguru import logger
+
+# Only near-deterministic requests are safe to replay from cache
+MAX_CACHEABLE_TEMPERATURE = 0.1
+
+
+class ResponseCache:
+    """
+    Persistent cache mapping a hash of a chat completion request to its reply.
+
+    A broken cache should never fail the actual request: if the database
+    cannot be opened, e.g. its directory is missing or read-only or the file
+    is corrupt, the cache is disabled and every lookup is a miss.
+
+    Attributes:
+        path: Location of the SQLite database file
+    """
+
+    def __init__(self, path: str = ".llm_cache.sqlite") -> None:
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            conn = sqlite3.connect(path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "prompt_hash TEXT PRIMARY KEY, "
+                "response BLOB NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Response cache at {path} disabled: {str(e)}")
+            return
+        self._conn = conn
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        request_args: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Build a stable key from the request parameters that affect the reply.
+
+        Args:
+            model: Model name
+            messages: List of message dictionaries with 'role' and 'content'
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens in the response
+            request_args: Any other request parameters, e.g. response_format
+
+        Returns:
+            Hex SHA256 digest of the canonicalized request
+        """
+        payload = json.dumps(
+            {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "request_args": request_args or {},
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached response for key, or None on a miss."""
+        if self._conn is None:
+            return None
+        try:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE prompt_hash = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read response cache: {str(e)}")
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, response: Any) -> None:
+        """Store a JSON-serializable response under key."""
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                (key, json.dumps(response), time.time()),
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            # A broken cache should never fail the actual request
+            logger.error(f"Failed to write response cache: {str(e)}")
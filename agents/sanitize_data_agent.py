@@ -1,12 +1,37 @@
 """Agent for sanitizing medical data by removing Protected Health Information (PHI)."""
 
-from typing import TypedDict, Optional
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+import asyncio
+import json
+import math
+import re
 from loguru import logger
-from openai import OpenAIError
-from agents.agent_base import AgentBase
+import openai
+from agents.agent_base import MODEL, AgentBase, OpenAIError, client
+from agents.tokenizer import MAX_CHARS_PER_TOKEN, count_tokens
 
+SANITIZE_TEMPERATURE = 0.1  # Lower temperature for more consistent output
+# Sanitized output repeats the input, and a placeholder can take more tokens
+# than the PHI it replaces, so up to this many output tokens per input token
+SANITIZE_OUTPUT_RATIO = 1.25
+# The response budget is scaled from the input's token count, plus a few
+# tokens of slack for short inputs, within these bounds
+SANITIZE_HEADROOM_TOKENS = 32
+SANITIZE_MAX_TOKENS = 3500
+SANITIZE_MIN_TOKENS = 64
+# Largest input whose sanitized copy still fits SANITIZE_MAX_TOKENS; with the
+# system prompt this stays within gpt-4's 8k context
+MAX_INPUT_TOKENS = int(SANITIZE_MAX_TOKENS / SANITIZE_OUTPUT_RATIO)
+# Longer inputs are rejected by length alone, without encoding them
+MAX_INPUT_CHARS = MAX_INPUT_TOKENS * MAX_CHARS_PER_TOKEN
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Batches that ended as "expired" may still have partial output
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
 
-class SanitizedResponse(TypedDict):
+
+@dataclass(slots=True)
+class SanitizedResponse:
     """Response type for data sanitization containing the processed data and metadata."""
 
     sanitized_data: str
@@ -21,6 +46,11 @@ class SanitizeDataTool(AgentBase):
     Inherits from AgentBase to leverage common agent functionality.
     """
 
+    # Placeholders the model substitutes for removed PHI
+    _PHI_PLACEHOLDER_RE = re.compile(
+        r"\[(?:NAME|DATE|ADDRESS|PHONE|EMAIL|SSN|MRN|ACCT)\]"
+    )
+
     def __init__(
         self,
         max_retries: int = 3,
@@ -35,7 +65,9 @@ class SanitizeDataTool(AgentBase):
             phi_types: List of PHI types to specifically target for removal
         """
         super().__init__(
-            name="sanitize_data_tool", max_retries=max_retries, verbose=verbose
+            name="sanitize_data_tool",
+            max_retries=max_retries,
+            verbose=verbose,
         )
         self.phi_types = phi_types or [
             "names",
@@ -49,82 +81,235 @@ class SanitizeDataTool(AgentBase):
             "biometric identifiers",
         ]
 
-    async def execute(self, medical_data: str) -> SanitizedResponse:
-        """Sanitize medical data by removing PHI.
+        # Built once so the system prompt is byte-identical across calls,
+        # which lets OpenAI's prefix cache reuse it
+        self._phi_types_str = ", ".join(self.phi_types)
+        self._system_prompt = (
+            "You are an AI assistant specialized in sanitizing medical data. "
+            "Remove all Protected Health Information (PHI) including: "
+            f"{self._phi_types_str}. "
+            "Replace removed PHI with appropriate placeholders (e.g., [NAME], [DATE]). "
+            "Preserve the medical context and meaning while ensuring HIPAA compliance."
+        )
 
-        Args:
-            medical_data: The medical data to sanitize
+    @staticmethod
+    def _validate_data(medical_data: str) -> Tuple[int, int]:
+        """Raise ValueError if medical_data is empty or exceeds MAX_INPUT_CHARS
+        or MAX_INPUT_TOKENS.
 
         Returns:
-            SanitizedResponse containing the sanitized data and metadata
-
-        Raises:
-            ValueError: If input data is empty or invalid
-            OpenAIError: If API call fails
+            The character and token lengths of medical_data, so callers need
+            not rescan or re-encode it
         """
-        # Input validation
-        if not medical_data or not medical_data.strip():
+        # isspace() checks for blank input without copying it like strip() does
+        if not medical_data or medical_data.isspace():
             raise ValueError("Medical data cannot be empty")
 
-        if len(medical_data) > 8000:  # Adjust limit based on your needs
-            raise ValueError("Input data exceeds maximum length")
+        if len(medical_data) > MAX_INPUT_CHARS:
+            raise ValueError(
+                "Input data exceeds maximum length "
+                f"({len(medical_data)} > {MAX_INPUT_CHARS} characters)"
+            )
 
-        # Construct the system prompt with specific PHI types
-        phi_types_str = ", ".join(self.phi_types)
-        system_prompt = (
-            "You are an AI assistant specialized in sanitizing medical data. "
-            f"Remove all Protected Health Information (PHI) including: {phi_types_str}. "
-            "Replace removed PHI with appropriate placeholders (e.g., [NAME], [DATE]). "
-            "Preserve the medical context and meaning while ensuring HIPAA compliance."
-        )
+        n_tokens = count_tokens(medical_data)
+        if n_tokens > MAX_INPUT_TOKENS:
+            raise ValueError(
+                "Input data exceeds maximum length "
+                f"({n_tokens} > {MAX_INPUT_TOKENS} tokens)"
+            )
+        return len(medical_data), n_tokens
 
-        messages = [
-            {"role": "system", "content": system_prompt},
+    def _build_messages(self, medical_data: str) -> List[Dict[str, str]]:
+        """Build the chat messages for sanitizing medical_data."""
+        return [
+            {"role": "system", "content": self._system_prompt},
             {
                 "role": "user",
                 "content": f"Sanitize the following medical data:\n\n{medical_data}",
             },
         ]
 
+    @staticmethod
+    def _max_tokens_for(n_tokens: int) -> int:
+        """Response token budget for an input of n_tokens tokens."""
+        budget = math.ceil(n_tokens * SANITIZE_OUTPUT_RATIO) + SANITIZE_HEADROOM_TOKENS
+        return max(SANITIZE_MIN_TOKENS, min(SANITIZE_MAX_TOKENS, budget))
+
+    @classmethod
+    def _build_result(
+        cls, sanitized_data: str, original_length: int
+    ) -> SanitizedResponse:
+        """Wrap the model output in a SanitizedResponse with its metadata."""
+        # Simple heuristic to detect if PHI was found and removed
+        phi_detected = bool(cls._PHI_PLACEHOLDER_RE.search(sanitized_data))
+
+        return SanitizedResponse(
+            sanitized_data=sanitized_data,
+            original_length=original_length,
+            sanitized_length=len(sanitized_data),
+            phi_detected=phi_detected,
+        )
+
+    async def execute(self, medical_data: str) -> SanitizedResponse:
+        """Sanitize medical data by removing PHI.
+
+        Args:
+            medical_data: The medical data to sanitize
+
+        Returns:
+            SanitizedResponse containing the sanitized data and metadata
+
+        Raises:
+            ValueError: If input data is empty or invalid
+            OpenAIError: If API call fails
+            TruncatedResponseError: If the sanitized output was cut off, which
+                would otherwise silently drop the end of the record
+        """
+        orig_len, n_tokens = self._validate_data(medical_data)
+        messages = self._build_messages(medical_data)
+
         try:
             if self.verbose:
-                logger.info(
-                    f"Processing {len(medical_data)} characters of medical data"
-                )
+                logger.info(f"Processing {orig_len} characters of medical data")
 
             response = await self.call_openai(
                 messages=messages,
-                temperature=0.1,  # Lower temperature for more consistent output
-                max_tokens=1000,
+                temperature=SANITIZE_TEMPERATURE,
+                max_tokens=self._max_tokens_for(n_tokens),
             )
 
-            sanitized_data = response["content"]
-
-            # Simple heuristic to detect if PHI was found and removed
-            phi_detected = any(
-                placeholder in sanitized_data
-                for placeholder in ["[NAME]", "[DATE]", "[ADDRESS]", "[PHONE]"]
-            )
-
-            result = SanitizedResponse(
-                sanitized_data=sanitized_data,
-                original_length=len(medical_data),
-                sanitized_length=len(sanitized_data),
-                phi_detected=phi_detected,
-            )
+            result = self._build_result(response, orig_len)
 
             if self.verbose:
                 logger.info(
-                    f"Sanitization complete. Original length: {result['original_length']}, "
-                    f"Sanitized length: {result['sanitized_length']}, "
-                    f"PHI detected: {result['phi_detected']}"
+                    f"Sanitization complete. Original length: {result.original_length}, "
+                    f"Sanitized length: {result.sanitized_length}, "
+                    f"PHI detected: {result.phi_detected}"
                 )
 
             return result
 
-        except OpenAIError as e:
+        except (OpenAIError, openai.OpenAIError) as e:
             logger.error(f"OpenAI API error during data sanitization: {str(e)}")
             raise
         except Exception as e:
             logger.error(f"Unexpected error during data sanitization: {str(e)}")
             raise
+
+    async def submit_batch(
+        self, docs: List[str], poll_interval: float = 30
+    ) -> List[Union[SanitizedResponse, OpenAIError]]:
+        """Sanitize many documents through the OpenAI Batch API.
+
+        Batch jobs cost half as much as regular requests and have separate,
+        much higher rate limits, but may take up to 24 hours to complete.
+        Use this for offline processing of large record sets.
+
+        Args:
+            docs: The medical data documents to sanitize
+            poll_interval: Seconds to wait between batch status checks
+
+        Returns:
+            Results in the same order as docs. Documents the batch failed to
+            process are returned as an agents.agent_base.OpenAIError carrying
+            the failure reason instead.
+
+        Raises:
+            ValueError: If any document is empty or invalid
+            OpenAIError: If the batch job ends without producing any output
+                or error file, e.g. when its input fails validation
+        """
+        doc_sizes = [self._validate_data(doc) for doc in docs]
+        if not docs:
+            # The API rejects an empty batch file, so there is nothing to submit
+            return []
+
+        lines = [
+            json.dumps(
+                {
+                    "custom_id": f"doc-{i}",
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": {
+                        "model": MODEL,
+                        "messages": self._build_messages(doc),
+                        "temperature": SANITIZE_TEMPERATURE,
+                        "max_tokens": self._max_tokens_for(n_tokens),
+                    },
+                }
+            )
+            for i, (doc, (_, n_tokens)) in enumerate(zip(docs, doc_sizes))
+        ]
+
+        batch_file = await client.files.create(
+            file=("sanitize_batch.jsonl", "\n".join(lines).encode()),
+            purpose="batch",
+        )
+        batch = await client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+        )
+        if self.verbose:
+            logger.info(f"Submitted batch {batch.id} with {len(docs)} documents")
+
+        while batch.status not in BATCH_TERMINAL_STATUSES:
+            await asyncio.sleep(poll_interval)
+            batch = await client.batches.retrieve(batch.id)
+
+        if batch.output_file_id is None and batch.error_file_id is None:
+            raise OpenAIError(
+                f"Batch {batch.id} ended with status {batch.status}: {batch.errors}"
+            )
+
+        # Successful requests land in the output file, failed ones in the
+        # error file; a job where every request failed has only the latter
+        lines: List[str] = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id is not None:
+                content = await client.files.content(file_id)
+                lines.extend(content.text.splitlines())
+        return self._parse_batch_output([size[0] for size in doc_sizes], lines)
+
+    @staticmethod
+    def _batch_error_reason(record: Dict[str, Any]) -> str:
+        """Extract a readable failure reason from a batch result line."""
+        error = record.get("error")
+        if not error:
+            response = record.get("response") or {}
+            error = (response.get("body") or {}).get("error")
+        if isinstance(error, dict):
+            return error.get("message") or error.get("code") or str(error)
+        return str(error) if error else "unknown error"
+
+    def _parse_batch_output(
+        self, doc_lengths: List[int], lines: List[str]
+    ) -> List[Union[SanitizedResponse, OpenAIError]]:
+        """Match batch output and error lines back to documents by custom_id."""
+        replies: Dict[str, str] = {}
+        failures: Dict[str, str] = {}
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") == 200:
+                choice = response["body"]["choices"][0]
+                if choice.get("finish_reason") == "length":
+                    failures[record["custom_id"]] = "response truncated at max_tokens"
+                else:
+                    replies[record["custom_id"]] = choice["message"]["content"]
+            else:
+                failures[record["custom_id"]] = self._batch_error_reason(record)
+
+        results: List[Union[SanitizedResponse, OpenAIError]] = []
+        for i, orig_len in enumerate(doc_lengths):
+            custom_id = f"doc-{i}"
+            sanitized_data = replies.get(custom_id)
+            if sanitized_data is None:
+                reason = failures.get(custom_id, "no result returned")
+                logger.error(f"[{self.name}] Batch document {i} failed: {reason}")
+                results.append(OpenAIError(f"Batch document {i} failed: {reason}"))
+            else:
+                results.append(self._build_result(sanitized_data, orig_len))
+        return results
@@ -0,0 +1,88 @@
+"""In-memory nearest-neighbour cache of responses keyed by input embeddings."""
+
+from typing import Optional
+import json
+import os
+import numpy as np
+from loguru import logger
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIM = 1536
+
+
+class SemanticCache:
+    """
+    Cache that returns a stored response when a new input is close enough, by
+    cosine similarity, to one seen before.
+
+    Use one cache per tool: entries are matched on the input text only, so a
+    cache shared between tools with different prompts would mix their replies.
+    For the same reason a hit ignores max_tokens and temperature.
+
+    Only use it where a reply written for a similar input is acceptable, such
+    as summaries. Never use it for output that must reproduce its own input,
+    such as sanitized records: a near-duplicate record differs in exactly the
+    details that matter, so a hit would return another patient's text.
+    For very large caches, the brute-force search here could be swapped for a
+    faiss.IndexFlatIP over the same normalized vectors.
+
+    Attributes:
+        threshold: Minimum cosine similarity for a cache hit
+        path: Optional file, ending in .npz, the cache is loaded from and
+            written to by save()
+    """
+
+    def __init__(self, threshold: float = 0.95, path: Optional[str] = None) -> None:
+        self.threshold = threshold
+        self.path = path
+        self._emb = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self._responses: list[str] = []
+        self._size = 0
+
+        if path and os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                self._emb = np.asarray(data["embeddings"], dtype=np.float32)
+                self._responses = json.loads(str(data["responses"]))
+            self._size = len(self._responses)
+            logger.info(f"Loaded {self._size} semantic cache entries from {path}")
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def normalize(vector: list[float]) -> np.ndarray:
+        """Convert an embedding to a unit-length float32 vector."""
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def lookup(self, vec: np.ndarray) -> Optional[str]:
+        """Return the response for the most similar input above threshold, if any."""
+        if self._size == 0:
+            return None
+        sims = self._emb[: self._size] @ vec
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        return self._responses[best]
+
+    def add(self, vec: np.ndarray, response: str) -> None:
+        """Store response for the input embedded as vec."""
+        if self._size == len(self._emb):
+            # Grow geometrically so appends are amortized O(1)
+            grown = np.empty((max(16, 2 * self._size), vec.shape[0]), dtype=np.float32)
+            grown[: self._size] = self._emb[: self._size]
+            self._emb = grown
+        self._emb[self._size] = vec
+        self._responses.append(response)
+        self._size += 1
+
+    def save(self) -> None:
+        """Write the cache to path, if one was given."""
+        if not self.path:
+            return
+        np.savez(
+            self.path,
+            embeddings=self._emb[: self._size],
+            responses=np.array(json.dumps(self._responses)),
+        )
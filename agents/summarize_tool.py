@@ -1,12 +1,22 @@
 """Tool for summarizing text content using OpenAI's API with error handling and logging."""
 
-from typing import TypedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+import json
 from loguru import logger
-from openai import OpenAIError
-from agents.agent_base import AgentBase
+import openai
+from agents.agent_base import (
+    MAX_RESPONSE_TOKENS,
+    AgentBase,
+    OpenAIError,
+    TruncatedResponseError,
+)
+from agents.semantic_cache import SemanticCache
+from agents.tokenizer import MAX_CHARS_PER_TOKEN, count_tokens
 
 
-class SummaryResponse(TypedDict):
+@dataclass(slots=True)
+class SummaryResponse:
     """Response type for medical text summarization containing the summary and metadata."""
 
     summary: str
@@ -15,6 +25,52 @@ class SummaryResponse(TypedDict):
     medical_terms_identified: list[str]  # New field for tracking medical terminology
 
 
+SYSTEM_PROMPT = (
+    "You are a medical AI assistant specialized in summarizing healthcare content. "
+    "Maintain clinical accuracy and preserve all critical medical information including: "
+    "- Diagnoses, conditions, and symptoms\n"
+    "- Medications, dosages, and treatments\n"
+    "- Lab results and vital signs\n"
+    "- Patient history and risk factors\n"
+    "Use precise medical terminology and maintain a professional clinical tone. "
+    "Also identify and list key medical terms used in the text."
+)
+
+# Largest prompt accepted by execute(); gpt-4's 8k context must also hold
+# the system prompt and up to 400 response tokens
+MAX_PROMPT_TOKENS = 6000
+# Longer prompts are rejected by length alone, without encoding them
+MAX_PROMPT_CHARS = MAX_PROMPT_TOKENS * MAX_CHARS_PER_TOKEN
+# Combined input + expected output tokens allowed in one batched request;
+# leaves headroom in gpt-4's 8k context for the system prompt
+BATCH_TOKEN_BUDGET = 6000
+# Batched requests use JSON mode, which base gpt-4 rejects with a 400.
+# Token budgets below are sized for gpt-4 and are conservative for this model.
+BATCH_MODEL = "gpt-4o"
+# Output tokens reserved per document in a batched request
+BATCH_SUMMARY_TOKENS = 300
+# Keeps a batch's combined response budget within MAX_RESPONSE_TOKENS
+MAX_BATCH_SIZE = MAX_RESPONSE_TOKENS // BATCH_SUMMARY_TOKENS
+
+
+def _split_terms(text: str) -> list[str]:
+    """Split a comma-separated list of medical terms, dropping empty entries."""
+    return [term.strip() for term in text.split(",") if term.strip()]
+
+
+def _batch_entry_terms(value: Any) -> list[str]:
+    """Normalize the medical_terms of a batched reply entry to a list of terms.
+
+    The model is asked for a JSON list but sometimes returns a single
+    comma-separated string, which would otherwise be iterated per character.
+    """
+    if isinstance(value, str):
+        return _split_terms(value)
+    if isinstance(value, list):
+        return [str(term).strip() for term in value if str(term).strip()]
+    return []
+
+
 class SummarizeTool(AgentBase):
     """Tool for summarizing medical texts using OpenAI's API.
 
@@ -22,9 +78,77 @@ class SummarizeTool(AgentBase):
     and healthcare documentation while preserving critical medical terminology.
     """
 
-    def __init__(self, max_retries: int = 2, verbose: bool = True) -> None:
+    def __init__(
+        self,
+        max_retries: int = 2,
+        verbose: bool = True,
+        semantic_cache: Optional[SemanticCache] = None,
+    ) -> None:
         super().__init__(
-            name="medical_summarize_tool", max_retries=max_retries, verbose=verbose
+            name="medical_summarize_tool",
+            max_retries=max_retries,
+            verbose=verbose,
+            semantic_cache=semantic_cache,
+        )
+        # Frozen so every request shares the same cacheable prompt prefix
+        self._system_msg = {"role": "system", "content": SYSTEM_PROMPT}
+
+    @staticmethod
+    def _validate_prompt(prompt: str) -> Tuple[int, int]:
+        """Raise ValueError if prompt is empty or exceeds MAX_PROMPT_CHARS or
+        MAX_PROMPT_TOKENS.
+
+        Returns:
+            The character and token lengths of prompt, so callers need not
+            rescan or re-encode it
+        """
+        # isspace() checks for blank input without copying it like strip() does
+        if not prompt or prompt.isspace():
+            raise ValueError("Prompt cannot be empty")
+
+        if len(prompt) > MAX_PROMPT_CHARS:
+            raise ValueError(
+                "Prompt exceeds maximum length "
+                f"({len(prompt)} > {MAX_PROMPT_CHARS} characters)"
+            )
+
+        n_tokens = count_tokens(prompt)
+        if n_tokens > MAX_PROMPT_TOKENS:
+            raise ValueError(
+                "Prompt exceeds maximum length "
+                f"({n_tokens} > {MAX_PROMPT_TOKENS} tokens)"
+            )
+        return len(prompt), n_tokens
+
+    def _build_messages(self, prompt: str) -> List[Dict[str, str]]:
+        """Build the chat messages for summarizing prompt."""
+        return [
+            self._system_msg,
+            {
+                "role": "user",
+                "content": f"Please provide a clinical summary of the following medical text, "
+                f"followed by a list of key medical terms used:\n\n{prompt}",
+            },
+        ]
+
+    @staticmethod
+    def _parse_response(response: str, orig_len: int) -> SummaryResponse:
+        """Split the model reply into the summary and its medical terms."""
+        # The terms list is the last section of the reply, so split on the
+        # final occurrence of the marker only
+        head, sep, tail = response.rpartition("\nMedical terms:")
+        if sep:
+            summary = head.strip()
+            medical_terms = _split_terms(tail)
+        else:
+            summary = response.strip()
+            medical_terms = []
+
+        return SummaryResponse(
+            summary=summary,
+            original_length=orig_len,
+            summary_length=len(summary),
+            medical_terms_identified=medical_terms,
         )
 
     async def execute(self, prompt: str) -> SummaryResponse:
@@ -40,54 +164,172 @@ class SummarizeTool(AgentBase):
             ValueError: If prompt is empty or too long
             OpenAIError: If API call fails
         """
-        # Input validation
-        if not prompt or not prompt.strip():
-            raise ValueError("Prompt cannot be empty")
+        orig_len, _ = self._validate_prompt(prompt)
+        messages = self._build_messages(prompt)
+
+        try:
+            response = await self.call_openai(
+                messages, max_tokens=400, semantic_key=prompt
+            )
+            return self._parse_response(response, orig_len)
+
+        except (OpenAIError, openai.OpenAIError) as e:
+            logger.error(f"OpenAI API error while summarizing text: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error while summarizing text: {str(e)}")
+            raise
+
+    async def stream_execute(
+        self, prompt: str
+    ) -> AsyncIterator[Union[str, SummaryResponse]]:
+        """Summarize medical text, yielding the reply as it is generated.
+
+        Lets callers render the summary immediately instead of waiting for
+        the full completion. Use execute() when only the final result matters.
 
-        if len(prompt) > 10000:  # Adjust limit as needed
-            raise ValueError("Prompt exceeds maximum length")
+        Args:
+            prompt: The medical text to summarize
+
+        Yields:
+            Pieces of the reply text as they arrive, then a final
+            SummaryResponse parsed from the complete reply
+
+        Raises:
+            ValueError: If prompt is empty or too long
+            OpenAIError: If API call fails
+        """
+        orig_len, _ = self._validate_prompt(prompt)
+        messages = self._build_messages(prompt)
+
+        chunks: List[str] = []
+        try:
+            async for chunk in self.stream_openai(messages, max_tokens=400):
+                chunks.append(chunk)
+                yield chunk
+        except (OpenAIError, openai.OpenAIError) as e:
+            logger.error(f"OpenAI API error while streaming summary: {str(e)}")
+            raise
 
+        yield self._parse_response("".join(chunks), orig_len)
+
+    async def batched_execute(self, prompts: List[str]) -> List[SummaryResponse]:
+        """Summarize several medical texts with as few API calls as possible.
+
+        Documents are packed into numbered lists that fit the token budget and
+        each list is summarized in a single request returning JSON, so the
+        system prompt is paid once per batch instead of once per document.
+
+        Args:
+            prompts: The medical texts to summarize
+
+        Returns:
+            One SummaryResponse per prompt, in input order
+
+        Raises:
+            ValueError: If any prompt is empty or too long
+            OpenAIError: If API call fails
+        """
+        token_counts = [self._validate_prompt(prompt)[1] for prompt in prompts]
+
+        results: List[SummaryResponse] = []
+        for batch in self._split_batches(prompts, token_counts):
+            results.extend(await self._summarize_batch(batch))
+        return results
+
+    @staticmethod
+    def _split_batches(prompts: List[str], token_counts: List[int]) -> List[List[str]]:
+        """Group prompts so each group's input and output fit BATCH_TOKEN_BUDGET.
+
+        Groups are also capped at MAX_BATCH_SIZE documents.
+        """
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for prompt, n_tokens in zip(prompts, token_counts):
+            prompt_tokens = n_tokens + BATCH_SUMMARY_TOKENS
+            if current and (
+                current_tokens + prompt_tokens > BATCH_TOKEN_BUDGET
+                or len(current) == MAX_BATCH_SIZE
+            ):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(prompt)
+            current_tokens += prompt_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _summarize_batch(self, batch: List[str]) -> List[SummaryResponse]:
+        """Summarize one batch in a single JSON-mode request.
+
+        Documents given a blank summary, or the whole batch if the reply is
+        truncated, not valid JSON or not numbered exactly 1 to len(batch),
+        fall back to individual execute() calls.
+        """
+        documents = "\n\n".join(f"{i}. {prompt}" for i, prompt in enumerate(batch, 1))
         messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are a medical AI assistant specialized in summarizing healthcare content. "
-                    "Maintain clinical accuracy and preserve all critical medical information including: "
-                    "- Diagnoses, conditions, and symptoms\n"
-                    "- Medications, dosages, and treatments\n"
-                    "- Lab results and vital signs\n"
-                    "- Patient history and risk factors\n"
-                    "Use precise medical terminology and maintain a professional clinical tone. "
-                    "Also identify and list key medical terms used in the text."
-                ),
-            },
+            self._system_msg,
             {
                 "role": "user",
-                "content": f"Please provide a clinical summary of the following medical text, "
-                f"followed by a list of key medical terms used:\n\n{prompt}",
+                "content": "Summarize each of the following numbered medical texts. "
+                'Return a JSON object {"results": [{"index": <number>, '
+                '"summary": <clinical summary>, "medical_terms": [<key medical terms>]}]} '
+                "with one entry per text, where index is the number shown before "
+                f"that text:\n\n{documents}",
             },
         ]
 
         try:
-            response = await self.call_openai(messages, max_tokens=400)
-
-            # Split the response into summary and medical terms
-            parts = response.split("\nMedical terms:")
-            summary = parts[0].strip()
-            medical_terms = []
-            if len(parts) > 1:
-                medical_terms = [term.strip() for term in parts[1].split(",")]
-
-            return SummaryResponse(
-                summary=summary,
-                original_length=len(prompt),
-                summary_length=len(summary),
-                medical_terms_identified=medical_terms,
+            response = await self.call_openai(
+                messages,
+                max_tokens=BATCH_SUMMARY_TOKENS * len(batch),
+                model=BATCH_MODEL,
+                response_format={"type": "json_object"},
             )
-
-        except OpenAIError as e:
-            logger.error(f"OpenAI API error while summarizing text: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error while summarizing text: {str(e)}")
+            entries = json.loads(response)["results"]
+            by_index: Dict[int, Dict[str, Any]] = {
+                int(entry["index"]): entry for entry in entries
+            }
+            # A misnumbered reply would attach summaries to the wrong
+            # documents, so it is only trusted if it numbers them exactly
+            expected = set(range(1, len(batch) + 1))
+            if len(entries) != len(batch) or by_index.keys() != expected:
+                raise ValueError(
+                    f"Batch reply indices {sorted(by_index)} do not match "
+                    f"documents 1-{len(batch)}"
+                )
+        except (
+            json.JSONDecodeError,
+            KeyError,
+            TypeError,
+            ValueError,
+            TruncatedResponseError,
+        ) as e:
+            logger.error(f"Could not parse batched summary response: {str(e)}")
+            by_index = {}
+        except (OpenAIError, openai.OpenAIError) as e:
+            logger.error(f"OpenAI API error while summarizing batch: {str(e)}")
             raise
+
+        results: List[SummaryResponse] = []
+        for i, prompt in enumerate(batch, 1):
+            entry = by_index.get(i) or {}
+            summary = str(entry.get("summary") or "").strip()
+            if not summary:
+                logger.warning(
+                    f"Document {i} missing or blank in batch reply, retrying alone"
+                )
+                results.append(await self.execute(prompt))
+                continue
+            results.append(
+                SummaryResponse(
+                    summary=summary,
+                    original_length=len(prompt),
+                    summary_length=len(summary),
+                    medical_terms_identified=_batch_entry_terms(
+                        entry.get("medical_terms")
+                    ),
+                )
+            )
+        return results
@@ -0,0 +1,52 @@
+"""Token counting helpers shared by the agents.
+
+tiktoken downloads the BPE file for an encoding the first time it is used.
+Set TIKTOKEN_CACHE_DIR to a directory holding that file, e.g. one populated
+at build time, to run without network access. If the tokenizer cannot be
+loaded, token counts are estimated from the text length instead.
+"""
+
+from functools import lru_cache
+from typing import Optional
+import math
+import tiktoken
+from loguru import logger
+from agents.agent_base import MODEL
+
+# Fallback estimate when no tokenizer is available. English averages about
+# 4 characters per token, so 3 errs towards overcounting
+CHARS_PER_TOKEN_ESTIMATE = 3
+# Character-length cutoff callers apply before encoding, as a multiple of
+# their token limit. Not a true bound: indented or tabular text can average
+# more characters per token, so very long but token-light inputs are rejected
+MAX_CHARS_PER_TOKEN = 20
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = MODEL) -> Optional[tiktoken.Encoding]:
+    """Return the tokenizer for model, loading it only once per process.
+
+    Returns None if it cannot be loaded, e.g. when offline with no
+    TIKTOKEN_CACHE_DIR, so callers fall back to an estimate.
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.warning(
+            f"Could not load tokenizer for {model}, estimating token counts: {str(e)}"
+        )
+        return None
+
+
+# Loaded at import so the blocking download never runs inside the event loop
+get_encoding(MODEL)
+
+
+def count_tokens(text: str, model: str = MODEL) -> int:
+    """Count the tokens text occupies in model's context window."""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN_ESTIMATE)
+    # User text is counted as plain text, so "<|endoftext|>" and the like are
+    # encoded as ordinary characters rather than rejected as special tokens
+    return len(encoding.encode(text, disallowed_special=()))
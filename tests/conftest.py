@@ -0,0 +1,7 @@
+"""Shared pytest setup for the agent tests."""
+
+import os
+
+# agents.agent_base builds its client at import, which requires a key; tests
+# mock every request, so any value works
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
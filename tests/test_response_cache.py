@@ -0,0 +1,46 @@
+"""Tests for the SQLite response cache."""
+
+from agents.response_cache import ResponseCache
+
+
+def test_round_trip(tmp_path):
+    """A stored response is returned for the same key only."""
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+
+    cache.set("key", "reply")
+
+    assert cache.get("key") == "reply"
+    assert cache.get("other") is None
+
+
+def test_make_key_depends_on_request_args():
+    """Requests differing only in extra parameters get different keys."""
+    messages = [{"role": "user", "content": "hi"}]
+
+    plain = ResponseCache.make_key("gpt-4", messages, 0.0, 10)
+    json_mode = ResponseCache.make_key(
+        "gpt-4", messages, 0.0, 10, {"response_format": {"type": "json_object"}}
+    )
+
+    assert plain != json_mode
+    assert plain == ResponseCache.make_key("gpt-4", messages, 0.0, 10, {})
+
+
+def test_unopenable_path_disables_cache(tmp_path):
+    """A path in a missing directory turns every call into a miss."""
+    cache = ResponseCache(str(tmp_path / "missing" / "cache.sqlite"))
+
+    cache.set("key", "reply")
+
+    assert cache.get("key") is None
+
+
+def test_corrupt_file_disables_cache(tmp_path):
+    """A file that is not a SQLite database turns every call into a miss."""
+    path = tmp_path / "cache.sqlite"
+    path.write_bytes(b"not a database" * 100)
+    cache = ResponseCache(str(path))
+
+    cache.set("key", "reply")
+
+    assert cache.get("key") is None
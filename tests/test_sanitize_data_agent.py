@@ -0,0 +1,29 @@
+"""Tests for SanitizeDataTool's batch submission."""
+
+import asyncio
+import pytest
+from agents import sanitize_data_agent
+from agents.sanitize_data_agent import SanitizeDataTool
+
+
+def test_submit_batch_with_no_docs_skips_upload(monkeypatch):
+    """An empty docs list returns [] without creating a batch job."""
+
+    async def fail_create(**_kwargs):
+        raise AssertionError("nothing should be uploaded")
+
+    monkeypatch.setattr(sanitize_data_agent.client.files, "create", fail_create)
+
+    assert not asyncio.run(SanitizeDataTool(verbose=False).submit_batch([]))
+
+
+def test_submit_batch_validates_before_upload(monkeypatch):
+    """A blank document fails validation before anything is uploaded."""
+
+    async def fail_create(**_kwargs):
+        raise AssertionError("nothing should be uploaded")
+
+    monkeypatch.setattr(sanitize_data_agent.client.files, "create", fail_create)
+
+    with pytest.raises(ValueError, match="empty"):
+        asyncio.run(SanitizeDataTool(verbose=False).submit_batch(["ok", "  "]))
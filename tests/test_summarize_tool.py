@@ -0,0 +1,177 @@
+"""Tests for SummarizeTool's batched summarization."""
+
+# The batching helpers under test are private to SummarizeTool
+# pylint: disable=protected-access
+
+from typing import Any, Dict, List
+import asyncio
+import json
+import pytest
+from agents import summarize_tool
+from agents.summarize_tool import (
+    BATCH_SUMMARY_TOKENS,
+    BATCH_TOKEN_BUDGET,
+    MAX_BATCH_SIZE,
+    MAX_PROMPT_CHARS,
+    SummarizeTool,
+    SummaryResponse,
+)
+
+
+def _reply(entries: List[Dict[str, Any]]) -> str:
+    """Serialize entries as a JSON-mode batch reply."""
+    return json.dumps({"results": entries})
+
+
+@pytest.fixture(name="tool")
+def fixture_tool(monkeypatch: pytest.MonkeyPatch) -> SummarizeTool:
+    """A SummarizeTool whose execute() fallback records the prompts it gets."""
+    tool = SummarizeTool(verbose=False)
+    tool.retried = []
+
+    async def fake_execute(prompt: str) -> SummaryResponse:
+        tool.retried.append(prompt)
+        return SummaryResponse(
+            summary=f"alone: {prompt}",
+            original_length=len(prompt),
+            summary_length=len(prompt) + 7,
+            medical_terms_identified=[],
+        )
+
+    monkeypatch.setattr(tool, "execute", fake_execute)
+    return tool
+
+
+def _mock_reply(
+    monkeypatch: pytest.MonkeyPatch, tool: SummarizeTool, reply: str
+) -> None:
+    """Make every call_openai() on tool return reply."""
+
+    async def fake_call_openai(*_args: Any, **_kwargs: Any) -> str:
+        return reply
+
+    monkeypatch.setattr(tool, "call_openai", fake_call_openai)
+
+
+def test_summarize_batch_matches_entries_by_index(monkeypatch, tool):
+    """Entries are matched to documents by index, in any order."""
+    _mock_reply(
+        monkeypatch,
+        tool,
+        _reply(
+            [
+                {"index": 2, "summary": "second", "medical_terms": ["asthma"]},
+                {"index": 1, "summary": "first", "medical_terms": "flu, fever"},
+            ]
+        ),
+    )
+
+    results = asyncio.run(tool._summarize_batch(["doc a", "doc b"]))
+
+    assert [r.summary for r in results] == ["first", "second"]
+    assert results[0].medical_terms_identified == ["flu", "fever"]
+    assert results[1].medical_terms_identified == ["asthma"]
+    assert not tool.retried
+
+
+def test_summarize_batch_retries_misnumbered_reply(monkeypatch, tool):
+    """A reply not numbered 1..n is discarded rather than misattributed."""
+    # Numbered from 0: trusting it would shift every summary by one document
+    _mock_reply(
+        monkeypatch,
+        tool,
+        _reply([{"index": i, "summary": f"s{i}"} for i in range(3)]),
+    )
+    batch = ["doc a", "doc b", "doc c"]
+
+    results = asyncio.run(tool._summarize_batch(batch))
+
+    assert tool.retried == batch
+    assert [r.summary for r in results] == [f"alone: {doc}" for doc in batch]
+
+
+def test_summarize_batch_retries_duplicate_indices(monkeypatch, tool):
+    """A reply repeating an index is discarded."""
+    _mock_reply(
+        monkeypatch,
+        tool,
+        _reply(
+            [
+                {"index": 1, "summary": "s1"},
+                {"index": 2, "summary": "s2"},
+                {"index": 2, "summary": "s2 again"},
+            ]
+        ),
+    )
+
+    asyncio.run(tool._summarize_batch(["doc a", "doc b"]))
+
+    assert tool.retried == ["doc a", "doc b"]
+
+
+def test_summarize_batch_retries_blank_summary_only(monkeypatch, tool):
+    """Only the document given a blank summary is retried."""
+    _mock_reply(
+        monkeypatch,
+        tool,
+        _reply([{"index": 1, "summary": "first"}, {"index": 2, "summary": "  "}]),
+    )
+
+    results = asyncio.run(tool._summarize_batch(["doc a", "doc b"]))
+
+    assert tool.retried == ["doc b"]
+    assert results[0].summary == "first"
+
+
+def test_summarize_batch_retries_invalid_json(monkeypatch, tool):
+    """An unparseable reply retries every document."""
+    _mock_reply(monkeypatch, tool, '{"results": [')
+
+    asyncio.run(tool._summarize_batch(["doc a", "doc b"]))
+
+    assert tool.retried == ["doc a", "doc b"]
+
+
+def test_split_batches_respects_token_budget():
+    """A batch closes before it would exceed BATCH_TOKEN_BUDGET."""
+    per_doc = BATCH_TOKEN_BUDGET // 2 - BATCH_SUMMARY_TOKENS
+    prompts = ["a", "b", "c"]
+
+    batches = SummarizeTool._split_batches(prompts, [per_doc] * 3)
+
+    assert batches == [["a", "b"], ["c"]]
+
+
+def test_split_batches_caps_batch_size():
+    """A batch never holds more than MAX_BATCH_SIZE prompts."""
+    prompts = [str(i) for i in range(MAX_BATCH_SIZE + 1)]
+
+    batches = SummarizeTool._split_batches(prompts, [1] * len(prompts))
+
+    assert [len(b) for b in batches] == [MAX_BATCH_SIZE, 1]
+
+
+def test_split_batches_keeps_oversized_prompt_alone():
+    """A prompt filling the budget on its own gets its own batch."""
+    batches = SummarizeTool._split_batches(["big", "small"], [BATCH_TOKEN_BUDGET, 1])
+
+    assert batches == [["big"], ["small"]]
+
+
+def test_batch_entry_terms_normalizes_values():
+    """medical_terms given as a string, list or nothing become a list."""
+    assert summarize_tool._batch_entry_terms("a, b,") == ["a", "b"]
+    assert summarize_tool._batch_entry_terms([" a ", ""]) == ["a"]
+    assert summarize_tool._batch_entry_terms(None) == []
+
+
+def test_validate_prompt_rejects_by_character_length(monkeypatch):
+    """Prompts over MAX_PROMPT_CHARS are rejected without being encoded."""
+
+    def fail_count_tokens(_text: str) -> int:
+        raise AssertionError("prompt should not be encoded")
+
+    monkeypatch.setattr(summarize_tool, "count_tokens", fail_count_tokens)
+
+    with pytest.raises(ValueError, match="characters"):
+        SummarizeTool._validate_prompt("x" * (MAX_PROMPT_CHARS + 1))
@@ -0,0 +1,42 @@
+"""Tests for the token counting helpers."""
+
+import pytest
+import tiktoken
+from agents import tokenizer
+
+
+@pytest.fixture(name="byte_encoding")
+def fixture_byte_encoding(monkeypatch: pytest.MonkeyPatch) -> tiktoken.Encoding:
+    """Replace the model tokenizer with one token per byte plus a special token.
+
+    Avoids downloading the real BPE file, which the tests may run without.
+    """
+    encoding = tiktoken.Encoding(
+        name="bytes",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={"<|endoftext|>": 256},
+    )
+    monkeypatch.setattr(tokenizer, "get_encoding", lambda model: encoding)
+    return encoding
+
+
+def test_count_tokens_uses_encoding(byte_encoding):
+    """Text is counted with the model's encoding."""
+    assert tokenizer.count_tokens("abc") == len(byte_encoding.encode("abc"))
+
+
+def test_count_tokens_accepts_special_token_text(byte_encoding):
+    """Control-token text in user input is counted, not rejected."""
+    text = "note <|endoftext|> more"
+
+    assert tokenizer.count_tokens(text) == len(
+        byte_encoding.encode(text, disallowed_special=())
+    )
+
+
+def test_count_tokens_estimates_without_encoding(monkeypatch):
+    """Without a tokenizer the count is estimated from the length."""
+    monkeypatch.setattr(tokenizer, "get_encoding", lambda model: None)
+
+    assert tokenizer.count_tokens("x" * 10) == 4